@@ -1,32 +1,55 @@
 #!/usr/bin/env python3
 import argparse
+import gzip
 import http.server
 import json
+import os
 import re
 import socketserver
+import threading
 import time
+import traceback
+from dataclasses import dataclass, field
+from typing import Optional
+from urllib.parse import parse_qs
 
-LOG_TAIL_BYTES = 120_000
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-def _regex(pattern: str) -> re.Pattern:
-    return re.compile(pattern, re.I)
+LOG_TAIL_BYTES = 128 * 1024
+TAIL_INTERVAL = 0.5
+LONG_POLL_TIMEOUT = 25.0
+TAIL_MARK_BYTES = 64
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
 
 
-def _detail_repo(line: str, current: str) -> str:
-    if "cloning" in line.lower():
+# Patterns are written in lowercase and matched against lowercased lines,
+# which keeps case folding out of the regex engine.
+def _regex(pattern: bytes) -> re.Pattern:
+    return re.compile(pattern)
+
+
+def _detail_repo(low: bytes, current: str) -> str:
+    if b"cloning" in low:
         return "Cloning fresh repo"
-    if "updating repo" in line.lower():
+    if b"updating repo" in low:
         return "Updating existing repo"
     return current
 
 
-def _detail_ui(line: str, current: str) -> str:
-    if "installing ui dependencies" in line.lower():
+def _detail_ui(low: bytes, current: str) -> str:
+    if b"installing ui dependencies" in low:
         return "Installing npm dependencies"
-    if "building ui" in line.lower():
+    if b"building ui" in low:
         return "Building UI bundle"
-    if "update_db" in line.lower():
+    if b"update_db" in low:
         return "Updating database schema"
     return current
 
@@ -37,9 +60,10 @@ AITK_STAGE_DEFS = [
         "label": "Repository",
         "detail": "Cloning ai-toolkit source",
         "patterns": [
-            _regex(r"\[ai-toolkit].*cloning repo"),
-            _regex(r"\[ai-toolkit].*updating repo"),
+            _regex(rb"\[ai-toolkit].*cloning repo"),
+            _regex(rb"\[ai-toolkit].*updating repo"),
         ],
+        "literals": [b"cloning repo", b"updating repo"],
         "detail_from_line": _detail_repo,
     },
     {
@@ -47,27 +71,30 @@ AITK_STAGE_DEFS = [
         "label": "Python environment",
         "detail": "Creating virtualenv and upgrading pip",
         "patterns": [
-            _regex(r"\[ai-toolkit].*creating venv"),
-            _regex(r"pip install --upgrade pip"),
+            _regex(rb"\[ai-toolkit].*creating venv"),
+            _regex(rb"pip install --upgrade pip"),
         ],
+        "literals": [b"creating venv", b"pip install --upgrade pip"],
     },
     {
         "id": "deps",
         "label": "Python deps",
         "detail": "Installing requirements",
         "patterns": [
-            _regex(r"\[ai-toolkit].*installing requirements"),
+            _regex(rb"\[ai-toolkit].*installing requirements"),
         ],
+        "literals": [b"installing requirements"],
     },
     {
         "id": "ui-build",
         "label": "UI build",
         "detail": "Preparing AI Toolkit UI",
         "patterns": [
-            _regex(r"installing UI dependencies"),
-            _regex(r"npm run build"),
-            _regex(r"npm run update_db"),
+            _regex(rb"installing ui dependencies"),
+            _regex(rb"npm run build"),
+            _regex(rb"npm run update_db"),
         ],
+        "literals": [b"installing ui dependencies", b"npm run build", b"npm run update_db"],
         "detail_from_line": _detail_ui,
     },
     {
@@ -75,45 +102,183 @@ AITK_STAGE_DEFS = [
         "label": "UI startup",
         "detail": "Starting ai-toolkit on :8675",
         "patterns": [
-            _regex(r"\[ai-toolkit].*starting UI"),
+            _regex(rb"\[ai-toolkit].*starting ui"),
         ],
+        "literals": [b"starting ui"],
     },
 ]
 
+AITK_COMBINED = re.compile(
+    b"|".join(
+        b"(?P<g%d_%d>%s)" % (idx, pos, pattern.pattern)
+        for idx, definition in enumerate(AITK_STAGE_DEFS)
+        for pos, pattern in enumerate(definition["patterns"])
+    )
+)
+GROUP_TO_STAGE = {
+    f"g{idx}_{pos}": idx
+    for idx, definition in enumerate(AITK_STAGE_DEFS)
+    for pos, _ in enumerate(definition["patterns"])
+}
+# Every pattern contains one of these lowercase literals, so lines without
+# any of them can skip the regex entirely.
+AITK_LITERALS = tuple(
+    literal for definition in AITK_STAGE_DEFS for literal in definition["literals"]
+)
+
+
+@dataclass
+class _TailState:
+    path: str = ""
+    fd: Optional[int] = None
+    inode: Optional[int] = None
+    offset: int = 0
+    carry: bytes = b""
+    mark: bytes = b""
+    stages: list = field(default_factory=list)
+    current_idx: Optional[int] = None
+
+
+_TAIL = _TailState()
+_TAIL_LOCK = threading.Lock()
+
+
+_STAGE_TEMPLATE = tuple(
+    {
+        "id": definition["id"],
+        "label": definition["label"],
+        "detail": definition.get("detail", ""),
+        "status": "pending",
+    }
+    for definition in AITK_STAGE_DEFS
+)
+
+
+def _new_stages():
+    return [stage.copy() for stage in _STAGE_TEMPLATE]
+
+
+def _reset_tail(state: _TailState, path: str) -> None:
+    if state.fd is not None:
+        os.close(state.fd)
+    state.path = path
+    state.fd = None
+    state.inode = None
+    state.offset = 0
+    state.carry = b""
+    state.mark = b""
+    state.stages = _new_stages()
+    state.current_idx = None
+
+
+def _newest_lines(buf, start: int, end: int):
+    # ``end`` sits just past a newline; slices are copied out one at a time so
+    # an early exit never touches the older part of the buffer.
+    while end > start:
+        cut = max(buf.rfind(b"\n", start, end - 1) + 1, start)
+        yield buf[cut : end - 1]
+        end = cut
+
+
+def _window_start(size: int, max_bytes: int) -> int:
+    start = max(size - max_bytes, 0)
+    return start - start % PAGE_SIZE
 
-def tail_lines(path: str, max_bytes: int = LOG_TAIL_BYTES):
+
+def _rewritten(state: _TailState) -> bool:
+    # start.sh truncates the log in place, and it can grow back past our
+    # offset between two polls; the bytes just before the offset give it away.
+    if not state.mark:
+        return False
     try:
-        with open(path, "rb") as handle:
-            handle.seek(0, os.SEEK_END)
-            size = handle.tell()
-            handle.seek(max(size - max_bytes, 0))
-            data = handle.read().decode("utf-8", errors="ignore")
-            return data.splitlines()
+        head = os.pread(state.fd, len(state.mark), state.offset - len(state.mark))
     except OSError:
-        return []
+        return True
+    return head != state.mark
 
 
-def compute_stage_states(lines):
-    stages = [
-        {
-            "id": definition["id"],
-            "label": definition["label"],
-            "detail": definition.get("detail", ""),
-            "status": "pending",
-        }
-        for definition in AITK_STAGE_DEFS
-    ]
-    current_idx = None
-    for line in lines:
-        for idx, definition in enumerate(AITK_STAGE_DEFS):
-            if any(pattern.search(line) for pattern in definition["patterns"]):
-                current_idx = idx
-                detail_fn = definition.get("detail_from_line")
-                if detail_fn:
-                    new_detail = detail_fn(line, stages[idx]["detail"])
-                    if new_detail:
-                        stages[idx]["detail"] = new_detail
-                break
+def read_new_lines(state: _TailState, path: str, max_bytes: int = LOG_TAIL_BYTES):
+    # Returns the complete lines appended since the previous call, newest first.
+    try:
+        st = os.stat(path)
+    except OSError:
+        _reset_tail(state, path)
+        return iter(())
+    if (
+        state.fd is None
+        or state.path != path
+        or state.inode != st.st_ino
+        or st.st_size < state.offset
+        or _rewritten(state)
+    ):
+        _reset_tail(state, path)
+        try:
+            state.fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return iter(())
+        state.inode = st.st_ino
+        if not st.st_size:
+            return iter(())
+        start = _window_start(st.st_size, max_bytes)
+        try:
+            data = os.pread(state.fd, st.st_size - start, start)
+        except OSError:
+            _reset_tail(state, path)
+            return iter(())
+        end = data.rfind(b"\n") + 1
+        state.offset = start + len(data)
+        state.carry = data[end:]
+        state.mark = data[-TAIL_MARK_BYTES:]
+        return _newest_lines(data, 0, end)
+    if st.st_size <= state.offset:
+        return iter(())
+    if st.st_size - state.offset > max_bytes:
+        state.offset = _window_start(st.st_size, max_bytes)
+        state.carry = b""
+    try:
+        data = os.pread(state.fd, st.st_size - state.offset, state.offset)
+    except OSError:
+        _reset_tail(state, path)
+        return iter(())
+    state.offset += len(data)
+    data = state.carry + data
+    end = data.rfind(b"\n") + 1
+    state.carry = data[end:]
+    state.mark = data[-TAIL_MARK_BYTES:]
+    return _newest_lines(data, 0, end)
+
+
+def advance_stage_states(stages, current_idx, newest_lines):
+    # Only the newest stage hit matters, so lines arrive newest first and the
+    # scan stops once the active stage and the details of every stage up to
+    # it are known.
+    unresolved = {
+        idx
+        for idx, definition in enumerate(AITK_STAGE_DEFS)
+        if definition.get("detail_from_line")
+    }
+    found_idx = None
+    for line in newest_lines:
+        low = line.lower()
+        if not any(literal in low for literal in AITK_LITERALS):
+            continue
+        match = AITK_COMBINED.search(low)
+        if not match:
+            continue
+        idx = GROUP_TO_STAGE[match.lastgroup]
+        if found_idx is None:
+            found_idx = idx
+        if idx in unresolved:
+            new_detail = AITK_STAGE_DEFS[idx]["detail_from_line"](low, "")
+            if new_detail:
+                stages[idx]["detail"] = new_detail
+                unresolved.discard(idx)
+        if not any(pending <= found_idx for pending in unresolved):
+            break
+    return current_idx if found_idx is None else found_idx
+
+
+def _mark_stage_status(stages, current_idx):
     if current_idx is None:
         if stages:
             stages[0]["status"] = "active"
@@ -129,13 +294,92 @@ def compute_stage_states(lines):
 
 
 def build_state_payload(log_path: str):
-    lines = tail_lines(log_path)
+    with _TAIL_LOCK:
+        lines = read_new_lines(_TAIL, log_path)
+        _TAIL.current_idx = advance_stage_states(_TAIL.stages, _TAIL.current_idx, lines)
+        stages = [dict(stage) for stage in _TAIL.stages]
+        current_idx = _TAIL.current_idx
     return {
         "timestamp": time.time(),
-        "stages": compute_stage_states(lines),
+        "stages": _mark_stage_status(stages, current_idx),
     }
 
 
+_CACHE = {"key": None, "version": 0, "stages": None, "entry": (None, b"")}
+# Counters restart with the process, so published versions (and the ETags
+# and ?since= values built from them) carry the start time too.
+_BOOT_TAG = f"{int(time.time()):x}"
+
+
+def _version_tag(version: int) -> str:
+    return f"{_BOOT_TAG}-{version:x}"
+_CACHE_LOCK = threading.Lock()
+_CHANGED = threading.Condition()
+_TIMESTAMP_RE = re.compile(rb'"timestamp":[^,}]+')
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def refresh_state_body(log_path: str):
+    try:
+        st = os.stat(log_path)
+        key = (st.st_mtime_ns, st.st_size)
+    except OSError:
+        key = None
+    with _CACHE_LOCK:
+        if key == _CACHE["key"] and _CACHE["entry"][1]:
+            return _CACHE["entry"]
+        payload = build_state_payload(log_path)
+        # Only a successful build settles the key; a failed one is retried.
+        _CACHE["key"] = key
+        # The log grows all through an install; only a stage change is news
+        # worth waking the long-pollers for.
+        if payload["stages"] == _CACHE["stages"] and _CACHE["entry"][1]:
+            return _CACHE["entry"]
+        version = _CACHE["version"] + 1
+        payload["version"] = _version_tag(version)
+        body = _dumps(payload)
+        etag = f'W/"{payload["version"]}"'
+        _CACHE["stages"] = payload["stages"]
+        with _CHANGED:
+            _CACHE["version"] = version
+            _CACHE["entry"] = (etag, body)
+            _CHANGED.notify_all()
+        return _CACHE["entry"]
+
+
+def wait_for_change(since: int, timeout: float = LONG_POLL_TIMEOUT) -> None:
+    with _CHANGED:
+        _CHANGED.wait_for(lambda: _CACHE["version"] != since, timeout)
+
+
+def current_state(log_path: str):
+    entry = _CACHE["entry"]
+    if not entry[1]:
+        entry = refresh_state_body(log_path)
+    return entry
+
+
+def _stamp_body(body: bytes) -> bytes:
+    stamp = b'"timestamp":' + repr(time.time()).encode("ascii")
+    return _TIMESTAMP_RE.sub(lambda _: stamp, body, count=1)
+
+
+def _tailer(log_path: str) -> None:
+    # Single producer: every poller is answered from the body it keeps fresh.
+    while True:
+        try:
+            refresh_state_body(log_path)
+        except Exception:
+            # Keep serving the last body, but leave a trace in the page's log.
+            traceback.print_exc()
+        time.sleep(TAIL_INTERVAL)
+
+
 HTML_PAGE = """<!doctype html>
 <html>
 <head>
@@ -201,17 +445,23 @@ HTML_PAGE = """<!doctype html>
       });
     }
 
+    let stateVersion = null;
+
     async function fetchState() {
+      let retryDelay = 2000;
       try {
-        const res = await fetch('/state?ts=' + Date.now(), { cache: 'no-store' });
+        const url = stateVersion === null ? '/state' : '/state?since=' + stateVersion;
+        const res = await fetch(url, { cache: 'no-cache' });
         if (res.ok) {
           const data = await res.json();
+          stateVersion = data.version;
           renderStages(data.stages);
+          retryDelay = 0;
         }
       } catch (err) {
         // ignore transient errors
       } finally {
-        window.setTimeout(fetchState, 2000);
+        window.setTimeout(fetchState, retryDelay);
       }
     }
 
@@ -242,56 +492,162 @@ HTML_PAGE = """<!doctype html>
 """
 
 
+# Heads stop short of the Connection header, which depends on the request.
+def _response_head(status: str, *headers: str) -> bytes:
+    lines = [f"HTTP/1.1 {status}", *headers]
+    return "".join(f"{line}\r\n" for line in lines).encode("latin-1")
+
+
+def _full_response(content_type: str, body: bytes, *headers: str):
+    head = _response_head(
+        "200 OK",
+        f"Content-Type: {content_type}",
+        *headers,
+        f"Content-Length: {len(body)}",
+    )
+    return head, body
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for token in header.split(","):
+        name, *params = (part.strip().lower() for part in token.split(";"))
+        weight = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        if name and weight > 0:
+            accepted.add(name)
+    return accepted
+
+
+_CONNECTION_TAIL = {
+    False: b"Connection: keep-alive\r\n\r\n",
+    True: b"Connection: close\r\n\r\n",
+}
+
+
+_HTML_BYTES = HTML_PAGE.encode("utf-8")
+_HTML_GZ = gzip.compress(_HTML_BYTES, compresslevel=9, mtime=0)
+_FULL_HTML_RESP = _full_response(
+    "text/html; charset=utf-8",
+    _HTML_BYTES,
+    "Cache-Control: no-store",
+    "Vary: Accept-Encoding",
+)
+_FULL_HTML_GZ_RESP = _full_response(
+    "text/html; charset=utf-8",
+    _HTML_GZ,
+    "Cache-Control: no-store",
+    "Vary: Accept-Encoding",
+    "Content-Encoding: gzip",
+)
+_FULL_HTML_BR_RESP = None
+if brotli is not None:
+    _FULL_HTML_BR_RESP = _full_response(
+        "text/html; charset=utf-8",
+        brotli.compress(_HTML_BYTES, quality=11),
+        "Cache-Control: no-store",
+        "Vary: Accept-Encoding",
+        "Content-Encoding: br",
+    )
+_FULL_HEALTHZ_RESP = _full_response("text/plain; charset=utf-8", b"ok")
+_FULL_STATUS_RESP = _full_response("text/plain; charset=utf-8", b"placeholder")
+
+
 class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Drop idle keep-alive connections instead of parking a thread on them.
+    timeout = 60
     log_path = "/ai_toolkit_setup.log"
+    _DATE_CACHE = (0, "")
+
+    def date_time_string(self, timestamp=None):
+        if timestamp is not None:
+            return super().date_time_string(timestamp)
+        now = int(time.time())
+        second, value = Handler._DATE_CACHE
+        if second != now:
+            value = super().date_time_string(now)
+            # A single tuple rebind, so concurrent handlers never see a torn pair.
+            Handler._DATE_CACHE = (now, value)
+        return value
+
+    def _write_response(self, head: bytes, body: bytes = b"") -> None:
+        self.wfile.write(head + _CONNECTION_TAIL[bool(self.close_connection)] + body)
 
     def do_GET(self):  # noqa: N802
-        if self.path.startswith("/healthz"):
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(b"ok")
-            return
-        if self.path.startswith("/status"):
-            data = b"placeholder"
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.send_header("Content-Length", str(len(data)))
-            self.end_headers()
-            self.wfile.write(data)
-            return
-        if self.path.startswith("/state"):
-            payload = build_state_payload(self.log_path)
-            encoded = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json; charset=utf-8")
-            self.send_header("Cache-Control", "no-store")
-            self.send_header("Content-Length", str(len(encoded)))
-            self.end_headers()
-            self.wfile.write(encoded)
+        route = self.path.partition("?")[0]
+        self._ROUTES.get(route, Handler._handle_index)(self)
+
+    def _handle_healthz(self):
+        self._write_response(*_FULL_HEALTHZ_RESP)
+
+    def _handle_status(self):
+        self._write_response(*_FULL_STATUS_RESP)
+
+    def _handle_state(self):
+        since = parse_qs(self.path.partition("?")[2]).get("since")
+        if since:
+            # A tag from an earlier process means the client has not seen
+            # anything we built yet, so it is answered straight away.
+            boot, _, counter = since[0].partition("-")
+            if boot == _BOOT_TAG:
+                try:
+                    wait_for_change(int(counter, 16))
+                except ValueError:
+                    pass
+        etag, body = current_state(self.log_path)
+        date = f"Date: {self.date_time_string()}"
+        if etag and self.headers.get("If-None-Match") == etag:
+            self._write_response(_response_head("304 Not Modified", date, f"ETag: {etag}"))
             return
-        encoded = HTML_PAGE.encode("utf-8")
-        self.send_response(200)
-        self.send_header("Content-Type", "text/html; charset=utf-8")
-        self.send_header("Cache-Control", "no-store")
-        self.send_header("Content-Length", str(len(encoded)))
-        self.end_headers()
-        self.wfile.write(encoded)
+        encoded = _stamp_body(body)
+        head = _response_head(
+            "200 OK",
+            date,
+            "Content-Type: application/json; charset=utf-8",
+            "Cache-Control: no-cache",
+            *([f"ETag: {etag}"] if etag else []),
+            f"Content-Length: {len(encoded)}",
+        )
+        self._write_response(head, encoded)
+
+    def _handle_index(self):
+        accepted = _accepted_encodings(self.headers.get("Accept-Encoding", ""))
+        if _FULL_HTML_BR_RESP is not None and "br" in accepted:
+            self._write_response(*_FULL_HTML_BR_RESP)
+        elif "gzip" in accepted:
+            self._write_response(*_FULL_HTML_GZ_RESP)
+        else:
+            self._write_response(*_FULL_HTML_RESP)
+
+    _ROUTES = {
+        "/healthz": _handle_healthz,
+        "/status": _handle_status,
+        "/state": _handle_state,
+    }
 
     def log_message(self, *_):  # noqa: A003
         return
 
 
-class ReuseTCPServer(socketserver.TCPServer):
+class ReuseTCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
     allow_reuse_address = True
+    daemon_threads = True
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", type=int, default=8675)
+    parser.add_argument("--refresh", type=int, default=2)  # kept for compatibility
     parser.add_argument("--files", nargs="*", default=["/ai_toolkit_setup.log"])
     args = parser.parse_args()
     Handler.log_path = args.files[0]
+    threading.Thread(target=_tailer, args=(Handler.log_path,), daemon=True).start()
     with ReuseTCPServer(("", args.port), Handler) as server:
         try:
             server.serve_forever()
@@ -1,15 +1,34 @@
 #!/usr/bin/env python3
 import argparse
+import gzip
 import http.server
 import importlib
 import json
 import os
 import re
+import socket
 import socketserver
+import threading
 import time
+import traceback
+from functools import lru_cache
 from pathlib import Path
+from types import MappingProxyType
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import re2
+except ImportError:
+    re2 = None
 
 LOG_TAIL_BYTES = 200_000
+TAIL_MARK_BYTES = 64
+LOG_OPEN_FLAGS = os.O_RDONLY | getattr(os, "O_NOATIME", 0)
+REFRESH_INTERVAL = 1.0
 SNAPSHOT_PATH = Path("/workspace/.backup_tmp/hf_pull/ComfyUI/custom_nodes_snapshot.yaml")
 
 RESTORE_CLONE_RE = re.compile(r"\[restore\]\s+cloning\s+(.+)", re.I)
@@ -18,6 +37,31 @@ RESTORE_SKIP_RE = re.compile(r"\[restore\]\s+([A-Za-z0-9._-]+)\s+already present
 RESTORE_ERR_RE = re.compile(r"\[restore]\[err[^\]]*\]\s*([^\s]+)", re.I)
 RESTORE_DONE_RE = re.compile(r"\[restore\]\s+nodes\s+&\s+settings\s+done", re.I)
 RESTORE_FAIL_LIST_RE = re.compile(r"\[restore]\[warn].*failed:\s*\[(.+)\]", re.I)
+# Checked in this order; the first pattern that hits a line claims it.
+RESTORE_EVENTS = [
+    ("clone", RESTORE_CLONE_RE),
+    ("cnr", RESTORE_CNR_RE),
+    ("skip", RESTORE_SKIP_RE),
+    ("err", RESTORE_ERR_RE),
+    ("fail_list", RESTORE_FAIL_LIST_RE),
+    ("done", RESTORE_DONE_RE),
+]
+# One lookahead per event, tried in order at each line start, so the
+# earliest entry still wins when a line matches several of them. RE2 has
+# no lookaheads, so this one always stays on re.
+RESTORE_ALT = re.compile(
+    b"^(?:"
+    + b"|".join(
+        b"(?=.*?(?P<%s>%s))" % (kind.encode(), pattern.pattern.encode())
+        for kind, pattern in RESTORE_EVENTS
+    )
+    + b")",
+    re.I | re.M,
+)
+RESTORE_VALUE_GROUP = {
+    kind: RESTORE_ALT.groupindex[kind] + 1 if pattern.groups else None
+    for kind, pattern in RESTORE_EVENTS
+}
 
 NODE_PROGRESS_RE = [
     re.compile(r"\[nodes\]\s+refreshing\s+([A-Za-z0-9._-]+)", re.I),
@@ -55,6 +99,17 @@ def _backup_detail(_: dict, backup_state: dict) -> str:
     return f"Restoring backup from {repo}"
 
 
+# Every stage pattern contains one of these (compared lowercased).
+_STAGE_HINTS = (
+    b"stage:",
+    b"persisting comfyui",
+    b"comfyui already present",
+    b"creating venv",
+    b"virtual_env:",
+)
+_RESTORE_HINTS = (b"[restore]",)
+
+
 def _update_backup_detail(line: str, current: str) -> str:
     clone = RESTORE_CLONE_RE.search(line)
     if clone:
@@ -149,22 +204,62 @@ STAGE_DEFS = [
     },
 ]
 
+_STAGE_PROBE = b"boot\nSTAGE: Checking CUDA\nCreating venv\nstage: starting comfyui\n"
 
-def tail_lines(path: str, max_bytes: int = LOG_TAIL_BYTES):
+
+def _compile_sweep(pattern: bytes, probe: bytes):
+    # RE2 scans the alternation in one linear pass; it is only used when it
+    # accepts the pattern and agrees with re on a known sample.
+    fallback = re.compile(pattern)
+    if re2 is None:
+        return fallback
     try:
-        with open(path, "rb") as handle:
-            handle.seek(0, os.SEEK_END)
-            size = handle.tell()
-            handle.seek(max(size - max_bytes, 0))
-            data = handle.read().decode("utf-8", errors="ignore")
-            return data.splitlines()
-    except OSError:
-        return []
+        compiled = re2.compile(pattern)
+        expected = [(m.lastindex, m.span()) for m in fallback.finditer(probe)]
+        if [(m.lastindex, m.span()) for m in compiled.finditer(probe)] == expected:
+            return compiled
+    except Exception:
+        pass
+    return fallback
+
+
+_STAGE_PATTERN = b"(?im)" + b"|".join(
+    b"(?P<st_%d_%d>%s)" % (idx, pos, pattern.pattern.encode())
+    for idx, definition in enumerate(STAGE_DEFS)
+    for pos, pattern in enumerate(definition["patterns"])
+)
+STAGE_ALT = _compile_sweep(_STAGE_PATTERN, _STAGE_PROBE)
+# Keyed by group number: RE2 reports bytes group names for bytes patterns.
+GROUP_TO_STAGE_IDX = {
+    re.compile(_STAGE_PATTERN).groupindex[f"st_{idx}_{pos}"]: idx
+    for idx, definition in enumerate(STAGE_DEFS)
+    for pos, _ in enumerate(definition["patterns"])
+}
+
 
+def _line_start(data: bytes, pos: int) -> int:
+    return data.rfind(b"\n", 0, pos) + 1
 
-_SNAPSHOT_CACHE = {"mtime": None, "nodes": []}
 
+def _line_at(data: bytes, start: int) -> str:
+    end = data.find(b"\n", start)
+    line = data[start:] if end < 0 else data[start:end]
+    return line.decode("utf-8", errors="replace")
 
+
+def _restore_events(data: bytes):
+    for match in RESTORE_ALT.finditer(data):
+        kind = match.lastgroup
+        group = RESTORE_VALUE_GROUP[kind]
+        value = match.group(group) if group else None
+        yield kind, value.decode("utf-8", errors="replace") if value else value
+
+
+_SNAPSHOT_CACHE = {"mtime": None, "nodes": (), "by_key": {}, "by_repo": {}}
+_EMPTY_SNAPSHOT = ((), {}, {})
+
+
+@lru_cache(maxsize=512)
 def _repo_label(repo_url: str) -> str:
     cleaned = repo_url.strip().rstrip("/")
     if cleaned.endswith(".git"):
@@ -172,6 +267,7 @@ def _repo_label(repo_url: str) -> str:
     return cleaned.split("/")[-1] if "/" in cleaned else cleaned
 
 
+@lru_cache(maxsize=512)
 def _normalize_repo(repo_url: str) -> str:
     cleaned = repo_url.strip()
     if cleaned.endswith(".git"):
@@ -182,19 +278,22 @@ def _normalize_repo(repo_url: str) -> str:
 def _load_backup_nodes():
     if not SNAPSHOT_PATH.exists():
         _SNAPSHOT_CACHE["mtime"] = None
-        _SNAPSHOT_CACHE["nodes"] = []
-        return []
+        _SNAPSHOT_CACHE["nodes"] = ()
+        _SNAPSHOT_CACHE["by_key"] = {}
+        _SNAPSHOT_CACHE["by_repo"] = {}
+        return _EMPTY_SNAPSHOT
     current_mtime = SNAPSHOT_PATH.stat().st_mtime
     if _SNAPSHOT_CACHE["mtime"] == current_mtime:
-        return _SNAPSHOT_CACHE["nodes"]
+        return _SNAPSHOT_CACHE["nodes"], _SNAPSHOT_CACHE["by_key"], _SNAPSHOT_CACHE["by_repo"]
     try:
         yaml = importlib.import_module("yaml")
     except Exception:
-        return []
+        return _EMPTY_SNAPSHOT
+    loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
     try:
-        data = yaml.safe_load(SNAPSHOT_PATH.read_text(encoding="utf-8")) or {}
+        data = yaml.load(SNAPSHOT_PATH.read_text(encoding="utf-8"), Loader=loader) or {}
     except Exception:
-        return []
+        return _EMPTY_SNAPSHOT
     nodes = []
     for repo_url, node_data in (data.get("git_custom_nodes") or {}).items():
         if isinstance(node_data, dict) and node_data.get("disabled"):
@@ -219,96 +318,98 @@ def _load_backup_nodes():
                 "version": "" if version is None else str(version),
             }
         )
-    _SNAPSHOT_CACHE["nodes"] = nodes
-    _SNAPSHOT_CACHE["mtime"] = current_mtime
-    return nodes
-
-
-def _apply_backup_progress(nodes, lines):
-    if not nodes:
-        return nodes
+    # Shared by every response; statuses live in a separate per-request list.
+    nodes = tuple(MappingProxyType(node) for node in nodes)
     index_by_key = {node["key"]: i for i, node in enumerate(nodes)}
     index_by_repo = {
         node["repo"]: i for i, node in enumerate(nodes) if node.get("repo")
     }
-    for node in nodes:
-        node["status"] = node.get("status") or "pending"
+    _SNAPSHOT_CACHE["nodes"] = nodes
+    _SNAPSHOT_CACHE["by_key"] = index_by_key
+    _SNAPSHOT_CACHE["by_repo"] = index_by_repo
+    _SNAPSHOT_CACHE["mtime"] = current_mtime
+    return nodes, index_by_key, index_by_repo
+
+
+def _apply_backup_progress(statuses, index_by_key, index_by_repo, events):
+    if not statuses:
+        return statuses
     active_idx = None
-    for line in lines:
-        clone = RESTORE_CLONE_RE.search(line)
-        if clone:
-            key = index_by_repo.get(_normalize_repo(clone.group(1)))
+    for kind, value in events:
+        if kind == "clone":
+            key = index_by_repo.get(_normalize_repo(value))
             if key is not None:
                 if (
                     active_idx is not None
-                    and nodes[active_idx]["status"] == "installing"
+                    and statuses[active_idx] == "installing"
                     and active_idx != key
                 ):
-                    nodes[active_idx]["status"] = "done"
+                    statuses[active_idx] = "done"
                 active_idx = key
-                nodes[key]["status"] = "installing"
+                statuses[key] = "installing"
             continue
-        cnr = RESTORE_CNR_RE.search(line)
-        if cnr:
-            key = index_by_key.get(cnr.group(1).strip())
+        if kind == "cnr":
+            key = index_by_key.get(value.strip())
             if key is not None:
                 if (
                     active_idx is not None
-                    and nodes[active_idx]["status"] == "installing"
+                    and statuses[active_idx] == "installing"
                     and active_idx != key
                 ):
-                    nodes[active_idx]["status"] = "done"
+                    statuses[active_idx] = "done"
                 active_idx = key
-                nodes[key]["status"] = "installing"
+                statuses[key] = "installing"
             continue
-        skip = RESTORE_SKIP_RE.search(line)
-        if skip:
-            node_key = skip.group(1).strip()
+        if kind == "skip":
+            node_key = value.strip()
             idx = index_by_key.get(node_key) or index_by_repo.get(
                 _normalize_repo(node_key)
             )
             if idx is not None:
-                nodes[idx]["status"] = "done"
+                statuses[idx] = "done"
             continue
-        err_match = RESTORE_ERR_RE.search(line)
-        if err_match:
-            node_key = err_match.group(1).strip()
+        if kind == "err":
+            node_key = value.strip()
             idx = index_by_key.get(node_key) or index_by_repo.get(
                 _normalize_repo(node_key)
             )
             if idx is not None:
-                nodes[idx]["status"] = "failed"
+                statuses[idx] = "failed"
             continue
-        fail_list = RESTORE_FAIL_LIST_RE.search(line)
-        if fail_list:
-            failed_nodes = fail_list.group(1).split(",")
+        if kind == "fail_list":
+            failed_nodes = value.split(",")
             for key in failed_nodes:
                 idx = index_by_key.get(key.strip()) or index_by_repo.get(
                     _normalize_repo(key.strip())
                 )
                 if idx is not None:
-                    nodes[idx]["status"] = "failed"
+                    statuses[idx] = "failed"
             continue
-        if RESTORE_DONE_RE.search(line):
-            for node in nodes:
-                if node["status"] in {"pending", "installing"}:
-                    node["status"] = "done"
+        if kind == "done":
+            for idx, status in enumerate(statuses):
+                if status in {"pending", "installing"}:
+                    statuses[idx] = "done"
             active_idx = None
-    if active_idx is not None and nodes[active_idx]["status"] == "installing":
+    if active_idx is not None and statuses[active_idx] == "installing":
         for idx in range(active_idx):
-            if nodes[idx]["status"] == "pending":
-                nodes[idx]["status"] = "done"
-    return nodes
+            if statuses[idx] == "pending":
+                statuses[idx] = "done"
+    return statuses
 
 
-def build_backup_state(lines):
+def build_backup_state(events):
     enabled = ENV_INFO["restore_enabled"] and ENV_INFO["backup_repo"]
     nodes = []
     has_manifest = False
     if enabled:
-        nodes = [dict(node) for node in _load_backup_nodes()]
-        has_manifest = bool(nodes)
-        nodes = _apply_backup_progress(nodes, lines)
+        metadata, index_by_key, index_by_repo = _load_backup_nodes()
+        has_manifest = bool(metadata)
+        statuses = _apply_backup_progress(
+            ["pending"] * len(metadata), index_by_key, index_by_repo, events
+        )
+        nodes = [
+            {**node, "status": status} for node, status in zip(metadata, statuses)
+        ]
     if not ENV_INFO["backup_repo"]:
         message = "Backup is not set."
     elif not ENV_INFO["restore_enabled"]:
@@ -327,64 +428,171 @@ def build_backup_state(lines):
     }
 
 
-def compute_stage_states(lines, backup_state):
-    stages = []
-    skip_ids = set()
-    if not backup_state["enabled"]:
-        skip_ids.update({"backup-manager", "backup-nodes"})
-    for definition in STAGE_DEFS:
+def _skipped_stage_ids(enabled) -> set:
+    return set() if enabled else {"backup-manager", "backup-nodes"}
+
+
+def scan_stage_hits(data: bytes, current_idx, details: dict, skip_ids: set):
+    last_line = -1
+    for match in STAGE_ALT.finditer(data):
+        idx = GROUP_TO_STAGE_IDX[match.lastindex]
+        if STAGE_DEFS[idx]["id"] in skip_ids:
+            continue
+        line_start = _line_start(data, match.start())
+        if line_start == last_line:
+            continue
+        last_line = line_start
+        current_idx = idx
+        detail_fn = STAGE_DEFS[idx].get("detail_from_line")
+        if detail_fn:
+            new_detail = detail_fn(_line_at(data, line_start), details.get(idx, ""))
+            if new_detail:
+                details[idx] = new_detail
+    return current_idx
+
+
+def compute_stage_states(backup_state, current_idx, details: dict):
+    skip_ids = _skipped_stage_ids(backup_state["enabled"])
+    skipped = [definition["id"] in skip_ids for definition in STAGE_DEFS]
+    stage_detail = []
+    for idx, definition in enumerate(STAGE_DEFS):
         base_detail = definition.get("detail")
         if callable(definition.get("detail_factory")):
             base_detail = definition["detail_factory"](ENV_INFO, backup_state)
-        stages.append(
-            {
-                "id": definition["id"],
-                "label": definition["label"],
-                "detail": base_detail or "",
-                "status": "pending",
-                "skipped": definition["id"] in skip_ids,
-            }
-        )
-        if definition["id"] in skip_ids:
-            stages[-1]["status"] = "done"
-    current_idx = None
-    for line in lines:
-        for idx, definition in enumerate(STAGE_DEFS):
-            if stages[idx]["skipped"]:
-                continue
-            if any(pattern.search(line) for pattern in definition["patterns"]):
-                current_idx = idx
-                detail_fn = definition.get("detail_from_line")
-                if detail_fn:
-                    new_detail = detail_fn(line, stages[idx]["detail"])
-                    if new_detail:
-                        stages[idx]["detail"] = new_detail
-                break
+        stage_detail.append(details.get(idx) or base_detail or "")
+    stage_status = ["done" if skip else "pending" for skip in skipped]
     if current_idx is None:
-        for idx, stage in enumerate(stages):
-            if stage["skipped"]:
+        for idx, skip in enumerate(skipped):
+            if not skip:
+                stage_status[idx] = "active"
+                break
+    else:
+        for idx, skip in enumerate(skipped):
+            if skip:
                 continue
-            stage["status"] = "active"
-            break
-        return stages
-    for idx, stage in enumerate(stages):
-        if stage["skipped"]:
-            continue
-        if idx < current_idx:
-            stage["status"] = "done"
-        elif idx == current_idx:
-            stage["status"] = "active"
-        else:
-            stage["status"] = "pending"
-    return stages
+            if idx < current_idx:
+                stage_status[idx] = "done"
+            elif idx == current_idx:
+                stage_status[idx] = "active"
+    return [
+        {
+            "id": definition["id"],
+            "label": definition["label"],
+            "detail": stage_detail[idx],
+            "status": stage_status[idx],
+            "skipped": skipped[idx],
+        }
+        for idx, definition in enumerate(STAGE_DEFS)
+    ]
+
+
+class LogTail:
+    def __init__(self, path: str, max_bytes: int = LOG_TAIL_BYTES) -> None:
+        self.path = path
+        self.max_bytes = max_bytes
+        self.fd = None
+        self.inode = None
+        self.pos = 0
+        self.mark = b""
+        self.buf = bytearray()
+        self._reset_parsed()
+
+    def _reset_parsed(self) -> None:
+        self.stage_idx = None
+        self.stage_details = {}
+        self.restore_events = []
+
+    def _close(self) -> None:
+        if self.fd is not None:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+        self.fd = None
+        self.inode = None
+        self.pos = 0
+        self.mark = b""
+        self.buf.clear()
+        self._reset_parsed()
+
+    def _open(self) -> bool:
+        self._close()
+        try:
+            try:
+                self.fd = os.open(self.path, LOG_OPEN_FLAGS)
+            except PermissionError:
+                # O_NOATIME is refused on files we do not own.
+                self.fd = os.open(self.path, os.O_RDONLY)
+            st = os.fstat(self.fd)
+        except OSError:
+            self._close()
+            return False
+        self.inode = st.st_ino
+        self.pos = max(st.st_size - self.max_bytes, 0)
+        return True
+
+    def _rewritten(self) -> bool:
+        # A log truncated in place can grow back past pos between two polls;
+        # the bytes just before pos give it away.
+        if not self.mark:
+            return False
+        try:
+            head = os.pread(self.fd, len(self.mark), self.pos - len(self.mark))
+        except OSError:
+            return True
+        return head != self.mark
+
+    def poll(self) -> None:
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self._close()
+            return
+        if (
+            self.fd is None
+            or st.st_ino != self.inode
+            or st.st_size < self.pos
+            or self._rewritten()
+        ):
+            if not self._open():
+                return
+        size = os.fstat(self.fd).st_size
+        if size <= self.pos:
+            return
+        try:
+            chunk = os.pread(self.fd, size - self.pos, self.pos)
+        except OSError:
+            self._close()
+            return
+        self.pos += len(chunk)
+        self.mark = (self.mark + chunk)[-TAIL_MARK_BYTES:]
+        self.buf += chunk
+        end = self.buf.rfind(b"\n") + 1
+        if not end:
+            return
+        data = bytes(self.buf[:end])
+        del self.buf[:end]
+        self._feed(data)
+
+    def _feed(self, data: bytes) -> None:
+        lowered = data.lower()
+        if any(hint in lowered for hint in _STAGE_HINTS):
+            enabled = ENV_INFO["restore_enabled"] and ENV_INFO["backup_repo"]
+            self.stage_idx = scan_stage_hits(
+                data, self.stage_idx, self.stage_details, _skipped_stage_ids(enabled)
+            )
+        if any(hint in lowered for hint in _RESTORE_HINTS):
+            self.restore_events.extend(_restore_events(data))
 
 
-def build_state_payload(log_path):
-    lines = tail_lines(log_path)
-    backup_state = build_backup_state(lines)
+def build_state_payload(tail: LogTail):
+    tail.poll()
+    backup_state = build_backup_state(tail.restore_events)
     return {
         "timestamp": time.time(),
-        "stages": compute_stage_states(lines, backup_state),
+        "stages": compute_stage_states(
+            backup_state, tail.stage_idx, tail.stage_details
+        ),
         "backup": backup_state,
         "env": {
             "backup_repo": ENV_INFO["backup_repo"],
@@ -395,6 +603,61 @@ def build_state_payload(log_path):
     }
 
 
+_STATE_CACHE = {"key": None, "payload_bytes": None}
+_TIMESTAMP_RE = re.compile(rb'"timestamp":\s*[^,}]+')
+_STATE_LOCK = threading.Lock()
+_PAYLOAD_REF = [None]
+
+
+def _dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8")
+
+
+def build_state_bytes(tail: LogTail) -> bytes:
+    with _STATE_LOCK:
+        return _build_state_bytes(tail)
+
+
+def _mtime_ns(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _stamp_body(body: bytes) -> bytes:
+    stamp = b'"timestamp":' + repr(time.time()).encode("ascii")
+    return _TIMESTAMP_RE.sub(lambda _: stamp, body, count=1)
+
+
+def _build_state_bytes(tail: LogTail) -> bytes:
+    try:
+        st = os.stat(tail.path)
+        key = (st.st_size, st.st_mtime_ns, _mtime_ns(SNAPSHOT_PATH))
+    except OSError:
+        key = None
+    if _STATE_CACHE["payload_bytes"] is not None and _STATE_CACHE["key"] == key:
+        # Nothing the payload is built from has moved; only the clock has.
+        data = _stamp_body(_STATE_CACHE["payload_bytes"])
+    else:
+        data = _dumps(build_state_payload(tail))
+        _STATE_CACHE["key"] = key
+    _STATE_CACHE["payload_bytes"] = data
+    return data
+
+
+def _refresher(tail: LogTail) -> None:
+    while True:
+        try:
+            _PAYLOAD_REF[0] = build_state_bytes(tail)
+        except Exception:
+            # Keep serving the last payload, but leave a trace in the page's log.
+            traceback.print_exc()
+        time.sleep(REFRESH_INTERVAL)
+
+
 HTML_PAGE = """<!doctype html>
 <html>
 <head>
@@ -586,48 +849,131 @@ HTML_PAGE = """<!doctype html>
 """
 
 
+# Heads stop short of the Connection header, which depends on the request.
+def _response_head(status: str, *headers: str) -> bytes:
+    lines = [f"HTTP/1.1 {status}", *headers]
+    return "".join(f"{line}\r\n" for line in lines).encode("latin-1")
+
+
+def _full_response(content_type: str, body: bytes, *headers: str):
+    head = _response_head(
+        "200 OK",
+        f"Content-Type: {content_type}",
+        *headers,
+        f"Content-Length: {len(body)}",
+    )
+    return head, body
+
+
+def _accepted_encodings(header: str) -> set:
+    accepted = set()
+    for token in header.split(","):
+        name, *params = (part.strip().lower() for part in token.split(";"))
+        weight = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    weight = float(param[2:])
+                except ValueError:
+                    weight = 0.0
+        if name and weight > 0:
+            accepted.add(name)
+    return accepted
+
+
+_CONNECTION_TAIL = {
+    False: b"Connection: keep-alive\r\n\r\n",
+    True: b"Connection: close\r\n\r\n",
+}
+
+
+_HTML_BYTES = HTML_PAGE.encode("utf-8")
+_HTML_GZIP = gzip.compress(_HTML_BYTES, 9)
+_OK_BYTES = b"ok"
+_PLACEHOLDER_BYTES = b"placeholder"
+_FULL_HTML_RESP = _full_response(
+    "text/html; charset=utf-8",
+    _HTML_BYTES,
+    "Vary: Accept-Encoding",
+    "Cache-Control: no-store",
+)
+_FULL_HTML_GZIP_RESP = _full_response(
+    "text/html; charset=utf-8",
+    _HTML_GZIP,
+    "Content-Encoding: gzip",
+    "Vary: Accept-Encoding",
+    "Cache-Control: no-store",
+)
+_FULL_HEALTHZ_RESP = _full_response("text/plain; charset=utf-8", _OK_BYTES)
+_FULL_STATUS_RESP = _full_response("text/plain; charset=utf-8", _PLACEHOLDER_BYTES)
+
+
 class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    timeout = 60
     log_path: str = "/server.log"
+    log_tails: dict = {}
+
+    @classmethod
+    def _log_tail(cls) -> LogTail:
+        with _STATE_LOCK:
+            tail = cls.log_tails.get(cls.log_path)
+            if tail is None:
+                tail = cls.log_tails[cls.log_path] = LogTail(cls.log_path)
+            return tail
+
+    def setup(self) -> None:
+        super().setup()
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def _write_response(self, head: bytes, body: bytes = b"") -> None:
+        self.wfile.write(head + _CONNECTION_TAIL[bool(self.close_connection)] + body)
 
     def do_GET(self) -> None:  # noqa: N802
-        if self.path.startswith("/healthz"):
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.end_headers()
-            self.wfile.write(b"ok")
-            return
-        if self.path.startswith("/status"):
-            data = b"placeholder"
-            self.send_response(200)
-            self.send_header("Content-Type", "text/plain; charset=utf-8")
-            self.send_header("Content-Length", str(len(data)))
-            self.end_headers()
-            self.wfile.write(data)
-            return
-        if self.path.startswith("/state"):
-            payload = build_state_payload(self.log_path)
-            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json; charset=utf-8")
-            self.send_header("Cache-Control", "no-store")
-            self.send_header("Content-Length", str(len(data)))
-            self.end_headers()
-            self.wfile.write(data)
-            return
-        self.send_response(200)
-        encoded = HTML_PAGE.encode("utf-8")
-        self.send_header("Content-Type", "text/html; charset=utf-8")
-        self.send_header("Content-Length", str(len(encoded)))
-        self.send_header("Cache-Control", "no-store")
-        self.end_headers()
-        self.wfile.write(encoded)
+        route = self.path.partition("?")[0]
+        self._ROUTES.get(route, Handler._handle_index)(self)
+
+    def _handle_healthz(self) -> None:
+        self._write_response(*_FULL_HEALTHZ_RESP)
+
+    def _handle_status(self) -> None:
+        self._write_response(*_FULL_STATUS_RESP)
+
+    def _handle_state(self) -> None:
+        data = _PAYLOAD_REF[0]
+        if data is None:
+            data = build_state_bytes(self._log_tail())
+        head = _response_head(
+            "200 OK",
+            f"Date: {self.date_time_string()}",
+            "Content-Type: application/json; charset=utf-8",
+            "Cache-Control: no-store",
+            f"Content-Length: {len(data)}",
+        )
+        self._write_response(head, data)
+
+    def _handle_index(self) -> None:
+        if "gzip" in _accepted_encodings(self.headers.get("Accept-Encoding", "")):
+            self._write_response(*_FULL_HTML_GZIP_RESP)
+        else:
+            self._write_response(*_FULL_HTML_RESP)
+
+    # /ready is what the page probes; until ComfyUI takes over the port it
+    # gets the same placeholder answer as /status.
+    _ROUTES = {
+        "/healthz": _handle_healthz,
+        "/status": _handle_status,
+        "/ready": _handle_status,
+        "/state": _handle_state,
+    }
 
     def log_message(self, format: str, *args) -> None:  # noqa: A003
         return
 
 
-class ReuseTCPServer(socketserver.TCPServer):
+class ReuseTCPServer(socketserver.ThreadingMixIn, http.server.HTTPServer):
     allow_reuse_address = True
+    daemon_threads = True
 
 
 if __name__ == "__main__":
@@ -637,6 +983,7 @@ if __name__ == "__main__":
     parser.add_argument("--files", nargs="*", default=["/server.log"])
     args = parser.parse_args()
     Handler.log_path = args.files[0]
+    threading.Thread(target=_refresher, args=(Handler._log_tail(),), daemon=True).start()
     with ReuseTCPServer(("", args.port), Handler) as server:
         try:
             server.serve_forever()